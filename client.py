@@ -1,6 +1,7 @@
 import configparser
 from iotnode.controller import Controller
 import logging
+import queue
 
 
 logging.basicConfig(
@@ -18,11 +19,39 @@ modules = [
 ]
 
 
+class DropOldestQueue(queue.Queue):
+    """Bounded queue that discards the oldest item instead of blocking."""
+
+    def put(self, item, block=True, timeout=None):
+        while True:
+            try:
+                return super(DropOldestQueue, self).put(item, block=False)
+            except queue.Full:
+                try:
+                    self.get_nowait()
+                except queue.Empty:
+                    pass
+
+
 class Client(Controller):
+    QUEUE_SIZE = 1024
+
     def __init__(self, *args, **kwargs):
+        self.mbus = DropOldestQueue(maxsize=self.QUEUE_SIZE)
         self.cache["config"] = config
         super(Client, self).__init__(*args, **kwargs)
 
+    def add_module(self, module):
+        super(Client, self).add_module(module)
+        original = self.modules[module[0]]["queue"]
+        bounded = DropOldestQueue(maxsize=self.QUEUE_SIZE)
+        self.modules[module[0]]["queue"] = bounded
+        self.modules[module[0]]["object"].queue = bounded
+        # The worker may already be blocked in get() on the original
+        # queue; a sentinel it handles as a no-op unparks it so it picks
+        # up the bounded queue on its next iteration.
+        original.put({"type": "__wake"})
+
 
 if __name__ == "__main__":
     node = Client(modules)
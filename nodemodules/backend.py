@@ -1,21 +1,44 @@
 from iotnode.module import NodeModule
-import json
+from queue import Empty
+import msgpack
 import socketio
 import logging
 import time
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 
 class BackendModule(NodeModule):
+    HEARTBEAT_INTERVAL = 5
+
     def __init__(self, *args, **kwargs):
         super(BackendModule, self).__init__(*args, **kwargs)
         self.connect()
 
     def connect(self):
         config = self.cache["config"]["backend"]
+        self.location = config["location"]
+        self._heartbeat = {"location": self.location}
+        self._next_beat = time.monotonic()
+        self._cctx = None
+        if config.getboolean("compress", fallback=False):
+            if zstandard:
+                self._cctx = zstandard.ZstdCompressor(level=1)
+            else:
+                logging.warning(
+                    "compress is enabled but zstandard is not installed, "
+                    "sending uncompressed"
+                )
         self.client_socket = socketio.Client()
+        auth = None
+        if config.get("token"):
+            auth = {"token": config["token"]}
         self.client_socket.connect(
             f"{config['host']}:{config['port']}",
-            auth={"token": config['token']},
+            auth=auth,
             retry=True,
         )
 
@@ -24,23 +47,48 @@ class BackendModule(NodeModule):
         exit()
 
     def callback_transcription(self, data):
-        data["data"]["location"] = self.cache["config"]["backend"]["location"]
-        logging.info(data["data"])
-        self.client_socket.emit("transcription", json.dumps(data["data"]))
+        batch = [data["data"]]
+        requeue = []
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except Empty:
+                break
+            if item.get("type") == "transcription":
+                batch.append(item["data"])
+            else:
+                requeue.append(item)
+        for item in requeue:
+            self.queue.put(item)
+        payload = {"location": self.location, "batch": batch}
+        logging.debug("%s", payload)
+        buf = msgpack.packb(payload, use_bin_type=True)
+        if self._cctx:
+            buf = self._cctx.compress(buf)
+        try:
+            self.client_socket.emit("transcription", buf)
+        except socketio.exceptions.SocketIOError as e:
+            logging.warning("Backend emit failed: %s", e)
 
     def callback_server_status(self, data):
         if self.client_socket.connected:
-            info = (
-                {
-                    "location": self.cache["config"]["backend"]["location"],
-                    "status": data["data"],
-                },
-            )
+            info = {
+                "location": self.location,
+                "status": data["data"],
+            }
             self.client_socket.emit("server", info)
 
     def tick(self):
-        if self.client_socket.connected:
-            self.client_socket.emit(
-                "heartbeat", {"location": self.cache["config"]["backend"]["location"]}
-            )
-            time.sleep(0.1)
+        now = time.monotonic()
+        if now >= self._next_beat:
+            if self.client_socket.connected:
+                try:
+                    self.client_socket.emit("heartbeat", self._heartbeat)
+                except socketio.exceptions.SocketIOError as e:
+                    logging.warning("Heartbeat emit failed: %s", e)
+            self._next_beat = now + self.HEARTBEAT_INTERVAL
+        timeout = max(0.0, self._next_beat - time.monotonic())
+        try:
+            self.processQueue(self.queue.get(True, timeout))
+        except Empty:
+            pass
@@ -5,9 +5,8 @@ MIT License
 """
 
 from iotnode.module import NodeModule
-import numpy as np
 import pyaudio
-import json
+import msgpack
 import websocket
 import threading
 import uuid
@@ -15,6 +14,16 @@ import time
 import logging
 from datetime import datetime, timedelta
 
+try:
+    from orjson import dumps, loads
+except ImportError:
+    import json
+
+    def dumps(obj):
+        return json.dumps(obj).encode("utf-8")
+
+    loads = json.loads
+
 
 class WhisperModule(NodeModule):
     INSTANCES = {}
@@ -30,10 +39,23 @@ class WhisperModule(NodeModule):
         self.task = "transcribe"
         self.use_vad = True
         self.client_start = datetime.now()
-        self.connected = False
+        self.ready = threading.Event()
         self.last_segment = None
         self.last_received_segment = None
+        self._last_start = 0.0
         self.transcript = []
+        self._latest_cache = (None, None)
+        self._iso_cache = {}
+        self._handshake = dumps(
+            {
+                "uid": self.uid,
+                "language": self.language,
+                "task": self.task,
+                "model": self.model,
+                "use_vad": self.use_vad,
+                "sample_format": "int16",
+            }
+        )
 
         self.connect()
 
@@ -45,7 +67,7 @@ class WhisperModule(NodeModule):
             on_open=lambda ws: self.on_open(ws),
             on_reconnect=lambda ws: self.on_open(ws),
             on_close=lambda ws, s, m: self.on_close(ws),
-            on_error=lambda ws, e: self.on_error(ws),
+            on_error=lambda ws, e: self.on_error(ws, e),
             on_message=lambda ws, message: self.on_message(ws, message),
         )
         self.sockthread = threading.Thread(target=self.thread_function)
@@ -55,117 +77,142 @@ class WhisperModule(NodeModule):
 
     def thread_function(self):
         while True:
-            self.client_socket.run_forever()
+            self.client_socket.run_forever(skip_utf8_validation=True)
             time.sleep(0.1)
 
     def cleanup(self):
         self.client_socket.close()
 
     def callback_audio(self, data):
-        if self.connected:
-            self.client_socket.send(
-                data["data"].tobytes(), websocket.ABNF.OPCODE_BINARY
-            )
+        if self.ready.is_set():
+            try:
+                self.client_socket.send(data["data"], websocket.ABNF.OPCODE_BINARY)
+            except websocket.WebSocketConnectionClosedException:
+                logging.warning("Server socket closed, dropped audio chunk")
 
     def handle_status_messages(self, message_data):
         """Handles server status messages."""
         status = message_data["status"]
         if status == "WAIT":
             logging.info(
-                f"Server is full. Estimated wait time {round(message_data['message'])} minutes."
+                "Server is full. Estimated wait time %s minutes.",
+                round(message_data["message"]),
             )
         elif status == "ERROR":
-            logging.error(f"Message from Server: {message_data['message']}")
+            logging.error("Message from Server: %s", message_data["message"])
             self.server_error = True
         elif status == "WARNING":
-            logging.error(f"Message from Server: {message_data['message']}")
-
-    def push_segment(self, seg, event="segment"):
-        ts = self.client_start + timedelta(seconds=float(seg["start"]))
-        self.push(
-            {
-                "type": "transcription",
-                "data": {
-                    "event": event,
-                    "timestamp": ts.isoformat(),
-                    "text": seg["text"],
-                },
-            }
-        )
+            logging.error("Message from Server: %s", message_data["message"])
+
+    def make_segment(self, seg, event="segment"):
+        start = seg["start"]
+        ts = self._iso_cache.get(start)
+        if ts is None:
+            if len(self._iso_cache) > 16:
+                self._iso_cache.clear()
+            ts = (self.client_start + timedelta(seconds=float(start))).isoformat()
+            self._iso_cache[start] = ts
+        return {
+            "event": event,
+            "timestamp": ts,
+            "text": seg["text"],
+        }
 
     def process_segments(self, segments):
-        print(segments)
+        logging.debug("%s", segments)
         latest_segment = segments.pop()
 
+        transcript = self.transcript
+        seen = set(transcript)
+        new_segs = []
         for seg in segments:
-            if seg["start"] not in self.transcript:
-                self.transcript.append(seg["start"])
-                self.push_segment(seg)
+            start = seg["start"]
+            if start not in seen:
+                seen.add(start)
+                transcript.append(start)
+                new_segs.append(self.make_segment(seg))
 
-        if self.last_segment and latest_segment:
-            if float(latest_segment["start"]) > float(self.last_segment["start"]) + 2.5:
-                self.push_segment(self.last_segment)
+        latest_start = float(latest_segment["start"])
+        if self.last_segment and latest_start > self._last_start + 2.5:
+            new_segs.append(self.make_segment(self.last_segment))
 
         self.last_segment = latest_segment
+        self._last_start = latest_start
 
-        self.push_segment(latest_segment, "latest")
+        if new_segs:
+            self.push(
+                {
+                    "type": "transcription",
+                    "data": {"event": "segments", "items": new_segs},
+                }
+            )
+
+        key = (latest_segment["start"], latest_segment["text"])
+        if key == self._latest_cache[0]:
+            self.push(self._latest_cache[1])
+        else:
+            message = {
+                "type": "transcription",
+                "data": self.make_segment(latest_segment, "latest"),
+            }
+            self._latest_cache = (key, message)
+            self.push(message)
 
-        self.transcript = self.transcript[-20:]
-        print(self.transcript)
+        del transcript[:-20]
+        logging.debug("%s", self.transcript)
 
     def on_message(self, ws, message):
-        message = json.loads(message)
+        if isinstance(message, bytes):
+            try:
+                message = msgpack.unpackb(message, raw=False)
+            except ValueError:
+                message = loads(message)
+        else:
+            message = loads(message)
 
         if self.uid != message.get("uid"):
             logging.error("invalid client uid")
             return
 
-        if "status" in message.keys():
+        if "status" in message:
             self.handle_status_messages(message)
             return
 
-        if "message" in message.keys() and message["message"] == "DISCONNECT":
+        if "message" in message and message["message"] == "DISCONNECT":
             logging.info("Server disconnected due to overtime.")
             self.recording = False
             self.cleanup()
+            return
 
-        if "message" in message.keys() and message["message"] == "SERVER_READY":
+        if "message" in message and message["message"] == "SERVER_READY":
             self.recording = True
+            self.ready.set()
             self.server_backend = message["backend"]
-            logging.info(f"Server Running with backend {self.server_backend}")
+            logging.info("Server Running with backend %s", self.server_backend)
             return
 
-        if "language" in message.keys():
+        if "language" in message:
             self.language = message.get("language")
             lang_prob = message.get("language_prob")
             logging.info(
-                f"Server detected language {self.language} with probability {lang_prob}"
+                "Server detected language %s with probability %s",
+                self.language,
+                lang_prob,
             )
             return
 
-        if "segments" in message.keys():
+        if "segments" in message:
             self.process_segments(message["segments"])
 
-    def on_error(self, ws):
-        logging.error(f"An error has occured")
+    def on_error(self, ws, error):
+        logging.error("Websocket error: %s", error)
 
     def on_open(self, ws):
-        self.connected = True
-        ws.send(
-            json.dumps(
-                {
-                    "uid": self.uid,
-                    "language": self.language,
-                    "task": self.task,
-                    "model": self.model,
-                    "use_vad": self.use_vad,
-                }
-            )
-        )
+        ws.send(self._handshake)
         self.push({"type": "server_status", "data": "connected"})
 
     def on_close(self, ws):
-        self.connected = False
+        self.ready.clear()
         self.push({"type": "server_status", "data": "disconnected"})
         self.cleanup()
 
@@ -192,21 +239,15 @@ class RecordModule(NodeModule):
                 frames_per_buffer=self.chunk,
             )
         except OSError as error:
-            logging.warning(f"Unable to access microphone. {error}")
+            logging.warning("Unable to access microphone. %s", error)
             self.stream = None
 
     def tick(self):
         data = self.stream.read(self.chunk, exception_on_overflow=False)
-        audio_array = self.bytes_to_float_array(data)
-        self.push({"type": "audio", "data": audio_array})
+        self.push({"type": "audio", "data": data})
 
     def cleanup(self):
         self.stream.stop_stream()
         self.stream.close()
         self.p.terminate()
         exit()
-
-    @staticmethod
-    def bytes_to_float_array(audio_bytes):
-        raw_data = np.frombuffer(buffer=audio_bytes, dtype=np.int16)
-        return raw_data.astype(np.float32) / 32768.0